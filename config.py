@@ -52,11 +52,13 @@ MONGODB_RETRY_READS = True
 
 # Configurações de processamento
 FACE_RECOGNITION_TOLERANCE = 0.6
-BATCH_LOCK_TIMEOUT = 5
+FACE_DETECTION_MAX_SIDE = 640  # Lado máximo usado na detecção (imagem é reduzida antes do HOG)
+BATCH_LOCK_TIMEOUT = 5  # minutos até um lote 'processing' voltar à disputa (processador morto)
 MIN_IMAGES_PER_BATCH = 3
 MAX_PROCESSING_WORKERS = 4
 BATCH_PROCESSING_TIMEOUT = 300
 FACE_DETECTION_MODEL = "hog"
+EMPLOYEE_CACHE_TTL = 30  # Recarga do cache de encodings (s) quando não há change stream
 
 # Configurações de armazenamento
 BASE_IMAGE_DIR = "captured_images"
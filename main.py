@@ -1,5 +1,4 @@
 import logging
-from datetime import datetime
 from modules.image_capture import ImageCapture
 from modules.face_processor import FaceProcessor
 from modules.db_handler import MongoDBHandler
@@ -1,13 +1,10 @@
 import logging
 import os
-from modules.face_processor import FaceProcessor
-from modules.db_handler import MongoDBHandler
+from modules.face_processor import detect_face_locations
+from modules.db_handler import MongoDBHandler, get_shared_client, derive_encoding_fields
 from config import MONGODB_URI
 import face_recognition
-import cv2
 from datetime import datetime
-from pymongo import MongoClient
-import numpy as np
 
 # Configuração do logging
 logging.basicConfig(
@@ -23,7 +20,8 @@ logger = logging.getLogger(__name__)
 
 class EmployeeManager:
     def __init__(self, mongodb_uri="mongodb://mongodb:27017/"):
-        self.client = MongoClient(mongodb_uri)
+        # Reusar o pool compartilhado em vez de abrir um MongoClient próprio
+        self.client = get_shared_client(mongodb_uri)
         self.db = self.client.face_recognition_db
         self.employees = self.db.employees
 
@@ -45,10 +43,10 @@ class EmployeeManager:
             if self.employees.find_one({"employee_id": employee_data['employee_id']}):
                 raise ValueError(f"Funcionário com ID {employee_data['employee_id']} já existe")
 
-            # Carregar e processar a foto
+            # Carregar e processar a foto (detecção em versão reduzida)
             image = face_recognition.load_image_file(photo_path)
-            face_locations = face_recognition.face_locations(image)
-            
+            face_locations = detect_face_locations(image)
+
             if not face_locations:
                 raise ValueError("Nenhuma face detectada na foto")
             if len(face_locations) > 1:
@@ -61,6 +59,7 @@ class EmployeeManager:
             employee_doc = {
                 **employee_data,
                 'encoding': encoding.tolist(),  # Converter numpy array para lista
+                **derive_encoding_fields(encoding),
                 'photo_path': photo_path,
                 'active': employee_data.get('active', True),
                 'created_at': datetime.now(),
@@ -91,11 +90,14 @@ class EmployeeManager:
             }
             
             if new_photo_path:
-                # Processar nova foto
+                # Processar nova foto (detecção em versão reduzida)
                 image = face_recognition.load_image_file(new_photo_path)
-                encoding = face_recognition.face_encodings(image)[0]
+                encoding = face_recognition.face_encodings(image, detect_face_locations(image))[0]
                 update_doc.update({
                     'encoding': encoding.tolist(),
+                    # Regenerar também as cópias derivadas: o cache de matching
+                    # prefere encoding_bin/encoding_q e seguiria na foto antiga
+                    **derive_encoding_fields(encoding),
                     'photo_path': new_photo_path
                 })
             
@@ -165,10 +167,10 @@ def processar_pasta_funcionarios(pasta="fotos"):
                 
                 logger.info(f"Processando: {nome} (ID: {id_funcionario})")
                 
-                # Carregar e processar a foto
+                # Carregar e processar a foto (detecção em versão reduzida)
                 image = face_recognition.load_image_file(caminho_foto)
-                face_locations = face_recognition.face_locations(image)
-                
+                face_locations = detect_face_locations(image)
+
                 if not face_locations:
                     logger.error(f"Nenhuma face detectada na foto de {nome}")
                     falhas += 1
@@ -193,8 +195,8 @@ def processar_pasta_funcionarios(pasta="fotos"):
                     'updated_at': datetime.now()
                 }
                 
-                # Inserir no banco
-                db_handler.employees.insert_one(employee_data)
+                # Inserir no banco (gera também a cópia quantizada do encoding)
+                db_handler.store_employee_encoding(employee_data)
                 logger.info(f"Funcionário {nome} cadastrado com sucesso")
                 sucessos += 1
                 
@@ -70,15 +70,24 @@ class IPCamera(BaseCamera):
         self.connection_timeout = connection_timeout
         self.cap = None
         self.last_retry = 0
+        # Sessão reutilizada nos testes de conexão: mantém keep-alive em vez
+        # de abrir um socket novo a cada retry
+        self.session = requests.Session()
+        if auth:
+            self.session.auth = auth
 
     def open(self):
         try:
-            # Testar conexão primeiro (para URLs HTTP)
+            # Testar conexão primeiro (para URLs HTTP): só o status importa,
+            # stream=True evita baixar o corpo (que pode ser um MJPEG infinito)
             if self.url.startswith('http'):
-                response = requests.get(self.url, timeout=self.connection_timeout, 
-                                     auth=self.auth if self.auth else None)
-                if response.status_code != 200:
-                    raise Exception(f"Erro de conexão: {response.status_code}")
+                response = self.session.get(self.url, timeout=self.connection_timeout,
+                                            stream=True)
+                try:
+                    if response.status_code != 200:
+                        raise Exception(f"Erro de conexão: {response.status_code}")
+                finally:
+                    response.close()
 
             self.cap = cv2.VideoCapture(self.url)
             if not self.cap.isOpened():
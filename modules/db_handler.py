@@ -1,20 +1,170 @@
-from pymongo import MongoClient, ReturnDocument, ASCENDING
+from pymongo import MongoClient, ASCENDING
 from pymongo.errors import PyMongoError, ConnectionFailure, ServerSelectionTimeoutError
+from bson.binary import Binary
 import backoff
 import logging
 import numpy as np
 from datetime import datetime, timedelta
 import os
 from config import (
-    MONGODB_URI, BATCH_LOCK_TIMEOUT, MONGODB_TIMEOUT_MS,
-    MONGODB_MAX_POOL_SIZE, MONGODB_RETRY_WRITES
+    MONGODB_TIMEOUT_MS, MONGODB_MAX_POOL_SIZE,
+    MONGODB_RETRY_WRITES, MONGODB_RETRY_READS,
+    EMPLOYEE_CACHE_TTL, BATCH_LOCK_TIMEOUT
 )
 import time
+import threading
+import queue
+import uuid
 from typing import Dict
-import face_recognition
+
+# Numba é um acelerador opcional: sem ele o matching cai no caminho NumPy
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# FAISS também é opcional: quando presente, a busca usa um IndexFlatL2
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# SimSIMD (kernels SIMD em C) cobre o caminho sem FAISS/numba
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Clientes compartilhados por connection string: um pool por processo em vez
+# de um MongoClient (e um pool de conexões) por instância de handler
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+# Connection strings cujos índices já foram garantidos neste processo
+_indexes_ensured = set()
+
+# Pipelines de update pré-construídos por status (update_batch_status roda a
+# cada lote; sem error_message o documento é sempre o mesmo)
+_BATCH_STATUS_UPDATES = {
+    status: [{'$set': {
+        'status': status,
+        'processed_at': '$$NOW' if status in ('completed', 'error') else None
+    }}]
+    for status in ('pending', 'processing', 'completed', 'error')
+}
+
+def _quantize_encoding(encoding):
+    """
+    Quantiza um encoding para int8 com escala por vetor
+
+    Cada componente vira round(x / escala) com escala = max(|x|) / 127,
+    o que reduz o armazenamento do vetor a um quarto do float32 com erro
+    bem abaixo da tolerância de matching (~0.6).
+    """
+    arr = np.asarray(encoding, dtype=np.float32)
+    max_abs = float(np.max(np.abs(arr))) if arr.size else 0.0
+    scale = max_abs / 127.0 if max_abs > 0 else 1.0
+    quantized = np.clip(np.rint(arr / scale), -127, 127).astype(np.int8)
+    return quantized.tolist(), scale
+
+def derive_encoding_fields(encoding):
+    """
+    Deriva do encoding canônico os campos compactos usados pelo cache
+
+    Toda escrita de funcionário (cadastro ou troca de foto) deve passar
+    por aqui: o cache de matching prefere encoding_bin/encoding_q à lista
+    de floats, então os três campos precisam sempre refletir o mesmo
+    vetor — um $set só de 'encoding' deixaria o matcher reconhecendo a
+    foto antiga para sempre.
+    """
+    arr = np.asarray(encoding, dtype=np.float32)
+    quantized, scale = _quantize_encoding(arr)
+    return {
+        'encoding_bin': Binary(arr.tobytes()),
+        'encoding_q': quantized,
+        'encoding_scale': scale
+    }
+
+def get_shared_client(connection_string):
+    """Retorna o MongoClient compartilhado da connection string"""
+    with _shared_clients_lock:
+        client = _shared_clients.get(connection_string)
+        if client is None:
+            client = MongoClient(
+                connection_string,
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGODB_TIMEOUT_MS,
+                retryWrites=MONGODB_RETRY_WRITES,
+                retryReads=MONGODB_RETRY_READS,
+                compressors='zlib'  # comprime o tráfego (lotes têm muito texto repetido)
+            )
+            _shared_clients[connection_string] = client
+        return client
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _best_match(mat, q, tol2):
+        """
+        Kernel de distância fundido (subtração + soma de quadrados + argmin)
+
+        Recebe a matriz (N, 128) de encodings em float32 C-contíguo e o
+        encoding de consulta; devolve (índice, distância²) do melhor match
+        dentro de tol², ou (-1, tol²) se nenhum funcionário passar.
+        """
+        n = mat.shape[0]
+        dists = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            s = 0.0
+            for k in range(mat.shape[1]):
+                d = mat[i, k] - q[k]
+                s += d * d
+            dists[i] = s
+
+        # Redução serial (barata) para evitar corrida no prange
+        best_i = -1
+        best_d = tol2
+        for i in range(n):
+            if dists[i] < best_d:
+                best_d = dists[i]
+                best_i = i
+        return best_i, best_d
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _batch_match(queries, mat, tol2):
+        """
+        Versão em lote do kernel: paraleliza sobre as consultas
+
+        Cada linha de `queries` é comparada com toda a matriz de encodings;
+        devolve arrays de índice (-1 sem match) e distância² por consulta.
+        Cada iteração do prange escreve apenas na própria posição, então
+        não há corrida.
+        """
+        nq = queries.shape[0]
+        ne = mat.shape[0]
+        d = queries.shape[1]
+        out_idx = np.full(nq, -1, dtype=np.int32)
+        out_dist = np.full(nq, np.inf, dtype=np.float32)
+        for i in prange(nq):
+            best = np.inf
+            best_j = -1
+            for j in range(ne):
+                s = 0.0
+                for k in range(d):
+                    x = queries[i, k] - mat[j, k]
+                    s += x * x
+                if s < best:
+                    best = s
+                    best_j = j
+            if best <= tol2:
+                out_idx[i] = best_j
+                out_dist[i] = best
+        return out_idx, out_dist
+
 class MongoDBHandler:
     def __init__(self, connection_string, max_retries=5, retry_interval=5):
         self.connection_string = connection_string
@@ -22,15 +172,73 @@ class MongoDBHandler:
         self.retry_interval = retry_interval
         self.client = None
         self.db = None
-        
+
+        # Identidade deste processador na loteria de lotes: a env var quando
+        # definida (docker-compose), senão um uuid por instância — dois
+        # handlers sem a env var não podem disputar lotes com o mesmo id
+        self.processor_id = os.getenv('PROCESSOR_ID') or str(uuid.uuid4())
+
+        # Cache em memória dos encodings dos funcionários (matriz (N, 128))
+        self._emp_matrix = None
+        self._emp_sq_norms = None
+        self._faiss_index = None
+        self._emp_ids = []
+        self._emp_names = []
+        self._emp_cache_version = 0   # versão refletida no cache
+        self._emp_data_version = 1    # incrementada a cada escrita de funcionário
+        self._emp_cache_ttl = None    # ativado se o change stream não estiver disponível
+        self._emp_cache_expiry = 0.0
+
+        # Cache TTL das estatísticas de processamento (consulta de polling)
+        self._stats_cache = None
+        self._stats_cache_expiry = 0.0
+
         # Tentar conectar com retry
         self._connect_with_retry()
-        
+
+        # Invalidação do cache por change stream (quando o servidor suporta)
+        self._start_employee_watcher()
+
+        # Thread de escrita: desacopla o registro das detecções do
+        # pipeline de reconhecimento. Fila limitada para backpressure: se o
+        # banco ficar para trás, o produtor bloqueia em vez de acumular
+        # documentos sem teto na memória
+        self._write_queue = queue.Queue(maxsize=100)
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+
+    def _start_employee_watcher(self):
+        """
+        Observa a coleção de funcionários e invalida o cache em mudanças
+
+        Escritas feitas por outros processos (scripts de cadastro, outra
+        instância do processador) não passam pelo contador de versão local;
+        um change stream cobre esses casos. Change streams exigem replica
+        set — no mongo standalone do docker-compose o watch() falha, e aí
+        o cache passa a expirar por TTL (EMPLOYEE_CACHE_TTL) para que
+        cadastros feitos por outro processo propaguem mesmo assim.
+        """
+        def _watch():
+            try:
+                pipeline = [{'$match': {
+                    'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}
+                }}]
+                with self.employees.watch(pipeline) as stream:
+                    for _ in stream:
+                        self._invalidate_employee_cache()
+            except PyMongoError:
+                self._emp_cache_ttl = EMPLOYEE_CACHE_TTL
+                logger.info("Change stream indisponível; cache de encodings "
+                            "passa a expirar a cada %ds", EMPLOYEE_CACHE_TTL)
+
+        self._watcher_thread = threading.Thread(target=_watch, daemon=True)
+        self._watcher_thread.start()
+
     def _connect_with_retry(self):
         """Tenta conectar ao MongoDB com retry"""
         for attempt in range(self.max_retries):
             try:
-                self.client = MongoClient(self.connection_string)
+                self.client = get_shared_client(self.connection_string)
                 # Testar conexão
                 self.client.admin.command('ping')
                 self.db = self.client.face_recognition_db
@@ -52,9 +260,13 @@ class MongoDBHandler:
         self.employees = self.db.employees        # Cadastro de funcionários
         self.batch_control = self.db.batch_control # Controle de lotes de imagens
         self.metrics = self.db.metrics            # Métricas do sistema
+        self.hourly_stats = self.db.hourly_stats  # Visão materializada por linha/hora
 
-        # Criar índices
-        self._create_indexes()
+        # Criar índices apenas uma vez por processo: createIndex é idempotente
+        # mas custa uma viagem ao servidor por índice a cada init
+        if self.connection_string not in _indexes_ensured:
+            self._create_indexes()
+            _indexes_ensured.add(self.connection_string)
 
     def _create_indexes(self):
         """
@@ -131,6 +343,7 @@ class MongoDBHandler:
         self.detections.create_index([("timestamp", 1)])
         self.detections.create_index([("production_line", 1), ("timestamp", 1)])
         self.detections.create_index([("employee_id", 1)])
+        self.detections.create_index([("line_id", 1), ("processed_at", -1)])
 
         # Índices para employees
         self.employees.create_index([("employee_id", 1)], unique=True)
@@ -142,11 +355,16 @@ class MongoDBHandler:
         self.batch_control.create_index([("line_id", 1), ("status", 1)])
         self.batch_control.create_index([("batch_path", 1)], unique=True)
         self.batch_control.create_index([("created_at", 1)])
-        self.batch_control.create_index([("processor_id", 1)])
+        # Atende tanto os contadores por status quanto consultas por
+        # processador; substitui o índice solto de processor_id
+        self.batch_control.create_index([("status", 1), ("processor_id", 1)])
 
         # Índices para metrics
         self.metrics.create_index([("timestamp", 1)])
 
+        # Índices para hourly_stats (visão materializada linha/hora)
+        self.hourly_stats.create_index([("line_id", 1), ("hour", 1)], unique=True)
+
     def register_detection(self, detection_data):
         """
         Registra uma detecção no banco de dados
@@ -162,10 +380,10 @@ class MongoDBHandler:
         """
         try:
             result = self.detections.insert_one(detection_data)
-            logger.info(f"Detecção registrada com ID: {result.inserted_id}")
+            logger.info("Detecção registrada com ID: %s", result.inserted_id)
             return result.inserted_id
         except Exception as e:
-            logger.error(f"Erro ao registrar detecção: {str(e)}")
+            logger.error("Erro ao registrar detecção: %s", e)
             raise
 
     def store_employee_encoding(self, employee_data):
@@ -180,28 +398,47 @@ class MongoDBHandler:
             }
         """
         try:
+            employee_data = dict(employee_data)
+
+            # Campo canônico das buscas é 'encoding'; chamadas antigas ainda
+            # passam 'face_encoding'
+            legacy_encoding = employee_data.pop('face_encoding', None)
+            if legacy_encoding is not None and 'encoding' not in employee_data:
+                employee_data['encoding'] = legacy_encoding
+
+            # Cópias compactas usadas pelo cache de matching: blob float32
+            # (BinData, decodificado com um frombuffer) e int8 quantizado
+            if 'encoding' in employee_data:
+                employee_data.update(derive_encoding_fields(employee_data['encoding']))
+
             result = self.employees.insert_one(employee_data)
-            logger.info(f"Encoding do funcionário armazenado: {employee_data['name']}")
+            self._invalidate_employee_cache()
+            logger.info("Encoding do funcionário armazenado: %s", employee_data['name'])
             return result.inserted_id
         except Exception as e:
-            logger.error(f"Erro ao armazenar encoding: {str(e)}")
+            logger.error("Erro ao armazenar encoding: %s", e)
             raise
 
     def get_all_encodings(self):
         """Retorna todos os encodings conhecidos"""
         try:
-            employees = list(self.employees.find({"encoding": {"$exists": True}}))
-            
-            if not employees:
+            # Uma única passada pelo cursor, sem materializar os documentos
+            rows = []
+            names = []
+            ids = []
+            for emp in self.employees.find({"encoding": {"$exists": True}}):
+                rows.append(emp["encoding"])
+                names.append(emp["name"])
+                ids.append(str(emp["_id"]))
+
+            if not rows:
                 logger.info("Nenhum encoding encontrado no banco")
                 return [], [], []  # Retornar 3 listas vazias
-            
-            # Extrair dados
-            encodings = [np.array(emp["encoding"]) for emp in employees]
-            names = [emp["name"] for emp in employees]
-            ids = [str(emp["_id"]) for emp in employees]
-            
-            logger.info(f"Carregados {len(encodings)} encodings do banco")
+
+            # Uma única conversão em bloco em vez de um np.array por documento
+            encodings = np.asarray(rows)
+
+            logger.info("Carregados %d encodings do banco", len(encodings))
             return encodings, names, ids
             
         except Exception as e:
@@ -213,22 +450,244 @@ class MongoDBHandler:
         try:
             # Registrar exatamente os campos recebidos, sem adicionar campos extras
             result = self.detections.insert_one(batch_data)
-            logger.info(f"Detecções do lote registradas com ID: {result.inserted_id}")
-            
+            self._update_hourly_stats(batch_data)
+            logger.info("Detecções do lote registradas com ID: %s", result.inserted_id)
+
         except Exception as e:
-            logger.error(f"Erro ao registrar detecções do lote: {str(e)}")
+            logger.error("Erro ao registrar detecções do lote: %s", e)
             raise
 
-    def get_pending_batches(self, line_id):
-        """Recupera lotes pendentes para uma linha"""
+    def register_batch_detections(self, batch_docs) -> None:
+        """
+        Registra detecções de vários lotes em uma única escrita
+
+        Usa insert_many(ordered=False) para que os documentos sigam em um
+        único comando e o servidor não serialize as inserções; um documento
+        inválido não bloqueia os demais.
+        """
+        if not batch_docs:
+            return
+
         try:
-            query = {
-                'line_id': line_id,
-                'status': 'pending'
+            # Documentos já saem prontos do processamento; pular a validação
+            # de esquema economiza uma passada no servidor
+            result = self.detections.insert_many(
+                batch_docs, ordered=False, bypass_document_validation=True
+            )
+            for batch_data in batch_docs:
+                self._update_hourly_stats(batch_data)
+            logger.info("Detecções de %d lotes registradas", len(result.inserted_ids))
+
+        except Exception as e:
+            logger.error("Erro ao registrar detecções em lote: %s", e)
+            raise
+
+    def get_monitoring_snapshot(self, line_id=None, recent_limit=20):
+        """
+        Retorna um snapshot consolidado para monitoramento
+
+        Junta em uma única chamada o que os monitores consultavam em
+        etapas separadas: estatísticas de processamento (cacheadas) e as
+        detecções recentes sem o array por funcionário.
+        """
+        return {
+            'timestamp': datetime.now(),
+            'processing_stats': self.get_processing_stats(),
+            'recent_detections': self.get_recent_detections(
+                line_id=line_id,
+                limit=recent_limit,
+                include_detections=False
+            )
+        }
+
+    def queue_batch_detection(self, batch_data: Dict) -> None:
+        """
+        Enfileira o registro de um lote para a thread de escrita
+
+        O processamento de faces não espera a viagem ao banco: o documento
+        entra em uma fila em memória e a thread de escrita coalesce o que
+        estiver pendente em um único insert_many. A fila é limitada: com o
+        banco fora do ar o put bloqueia, segurando o processamento em vez
+        de perder documentos.
+        """
+        self._write_queue.put(batch_data)
+
+    @backoff.on_exception(backoff.expo, PyMongoError, max_tries=5)
+    def _persist_batch_docs(self, batch_docs):
+        """Grava os documentos enfileirados com retry exponencial"""
+        self.register_batch_detections(batch_docs)
+
+    def _writer_loop(self):
+        """Consome a fila de detecções e grava em lotes coalescidos"""
+        while True:
+            batch_docs = [self._write_queue.get()]
+
+            # Levar junto o que mais estiver na fila (até um teto razoável)
+            try:
+                while len(batch_docs) < 50:
+                    batch_docs.append(self._write_queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            try:
+                self._persist_batch_docs(batch_docs)
+            except Exception as e:
+                # Esses documentos são a saída principal do sistema (histórico,
+                # estatísticas horárias): com os retries esgotados, devolvê-los
+                # à fila para a próxima rodada em vez de descartá-los
+                logger.error("Erro na thread de escrita de detecções: %s", e)
+                dropped = 0
+                for doc in batch_docs:
+                    try:
+                        self._write_queue.put_nowait(doc)
+                    except queue.Full:
+                        dropped += 1
+                if dropped:
+                    logger.error("Fila de escrita cheia: %d lotes perdidos", dropped)
+                time.sleep(self.retry_interval)
+
+    def _update_hourly_stats(self, batch_data):
+        """
+        Atualiza incrementalmente a visão materializada por linha/hora
+
+        Um upsert com $inc por lote mantém os totais horários prontos para
+        leitura, em vez de reagregar a coleção de detecções a cada consulta
+        de dashboard.
+        """
+        try:
+            when = (batch_data.get('capture_datetime')
+                    or batch_data.get('processed_at')
+                    or datetime.now())
+            hour = when.replace(minute=0, second=0, microsecond=0)
+
+            self.hourly_stats.update_one(
+                {'line_id': batch_data.get('line_id'), 'hour': hour},
+                {'$inc': {
+                    'batches': 1,
+                    'total_images': batch_data.get('total_images', 0),
+                    'total_faces_detected': batch_data.get('total_faces_detected', 0),
+                    'total_faces_recognized': batch_data.get('total_faces_recognized', 0),
+                    'total_faces_unknown': batch_data.get('total_faces_unknown', 0)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            # Estatísticas horárias não podem derrubar o registro do lote
+            logger.error("Erro ao atualizar estatísticas horárias: %s", e)
+
+    def get_hourly_stats(self, line_id, since=None):
+        """Lê a visão materializada de uma linha (opcionalmente desde `since`)"""
+        try:
+            query = {'line_id': line_id}
+            if since is not None:
+                query['hour'] = {'$gte': since}
+
+            return self._fetch_hourly_stats(query)
+        except Exception as e:
+            logger.error("Erro ao ler estatísticas horárias: %s", e)
+            return []
+
+    @backoff.on_exception(backoff.expo, PyMongoError, max_tries=3)
+    def _fetch_hourly_stats(self, query):
+        """Executa a leitura da visão horária com retry exponencial"""
+        return list(self.hourly_stats
+                    .find(query, {'_id': 0})
+                    .sort('hour', ASCENDING))
+
+    def get_recent_detections(self, line_id=None, limit=100, include_detections=True):
+        """
+        Retorna as detecções de lote mais recentes
+
+        A projeção devolve apenas os campos usados pelos consumidores
+        (nada de _id/processor_id), a ordenação usa o índice
+        (line_id, processed_at) e batch_size=limit faz o cursor vir em
+        uma única viagem ao servidor. Com include_detections=False só os
+        agregados do lote trafegam — suficiente para listagens/histórico.
+        """
+        try:
+            query = {'line_id': line_id} if line_id else {}
+            projection = {
+                '_id': 0,
+                'line_id': 1,
+                'batch_path': 1,
+                'processed_at': 1,
+                'total_images': 1,
+                'total_faces_detected': 1,
+                'total_faces_recognized': 1,
+                'total_faces_unknown': 1,
+                'avg_confidence': 1
             }
-            
-            return list(self.batch_control.find(query))
-            
+            if include_detections:
+                projection['detections'] = 1
+
+            return self._fetch_recent_detections(query, projection, limit)
+
+        except Exception as e:
+            logger.error(f"Erro ao obter detecções recentes: {str(e)}")
+            return []
+
+    @backoff.on_exception(backoff.expo, PyMongoError, max_tries=3)
+    def _fetch_recent_detections(self, query, projection, limit):
+        """Executa a consulta de detecções recentes com retry exponencial"""
+        cursor = (self.detections
+                  .find(query, projection)
+                  .sort('processed_at', -1)
+                  .limit(limit)
+                  .batch_size(limit))
+
+        return list(cursor)
+
+    def get_pending_batches(self, line_id):
+        """
+        Reivindica e retorna lotes pendentes de uma linha
+
+        Loteria em três viagens ao servidor: busca os _ids reivindicáveis
+        (pendentes, ou 'processing' com lock vencido de um processador
+        morto), marca todos de uma vez com um update_many que carimba
+        processor_id e lock_timestamp — o filtro re-checa a condição, então
+        lotes levados por outro processador no meio do caminho são pulados —
+        e por fim busca de volta os documentos que ficaram com o
+        processor_id desta instância. Dois processadores nunca retornam o
+        mesmo lote.
+        """
+        try:
+            # Locks de 'processing' mais antigos que isso são de um
+            # processador que morreu no meio do lote: voltam à disputa
+            stale_before = datetime.now() - timedelta(minutes=BATCH_LOCK_TIMEOUT)
+            claimable = {'line_id': line_id, '$or': [
+                {'status': 'pending'},
+                {'status': 'processing', 'lock_timestamp': {'$lt': stale_before}}
+            ]}
+
+            # Candidatos atuais (só os _ids), no máximo 10 por rodada: sem o
+            # teto, um processador reivindicaria o backlog inteiro após uma
+            # parada e, caindo, deixaria tudo preso em 'processing'
+            candidate_ids = [doc['_id'] for doc in self.batch_control
+                             .find(claimable, {'_id': 1})
+                             .sort('created_at', ASCENDING)
+                             .limit(10)]
+
+            if not candidate_ids:
+                return []
+
+            # Loteria por _id: o filtro re-checa a condição, então lotes que
+            # outro processador levou no meio do caminho são simplesmente
+            # pulados — três viagens ao servidor no total, qualquer que seja N
+            self.batch_control.update_many(
+                {'_id': {'$in': candidate_ids}, '$or': claimable['$or']},
+                {'$set': {
+                    'status': 'processing',
+                    'processor_id': self.processor_id,
+                    'lock_timestamp': datetime.now()
+                }}
+            )
+
+            return list(self.batch_control
+                        .find({'_id': {'$in': candidate_ids},
+                               'status': 'processing',
+                               'processor_id': self.processor_id})
+                        .sort('created_at', ASCENDING))
+
         except Exception as e:
             logger.error(f"Erro ao obter lotes pendentes: {str(e)}")
             return []
@@ -246,86 +705,118 @@ class MongoDBHandler:
                 'lock_timestamp': None,
                 'processor_id': None
             })
-            logger.info(f"Novo lote registrado: {batch_path}")
+            logger.info("Novo lote registrado: %s", batch_path)
         except Exception as e:
-            logger.error(f"Erro ao registrar lote: {str(e)}")
+            logger.error("Erro ao registrar lote: %s", e)
 
     def update_batch_status(self, batch_path, status, error_message=None):
-        """Atualiza o status de um lote"""
-        update = {
-            'status': status,
-            'processed_at': datetime.now() if status in ['completed', 'error'] else None
-        }
+        """
+        Atualiza o status de um lote
+
+        Usa update com pipeline para carimbar processed_at com $$NOW no
+        servidor, em vez de um datetime.now() do cliente (evita depender
+        do relógio de cada processador). O caminho comum (sem mensagem de
+        erro) reutiliza pipelines pré-construídos por status.
+        """
         if error_message:
-            update['error_message'] = error_message
+            pipeline = [{'$set': {
+                'status': status,
+                'processed_at': '$$NOW' if status in ('completed', 'error') else None,
+                'error_message': {'$literal': error_message}
+            }}]
+        else:
+            pipeline = _BATCH_STATUS_UPDATES.get(
+                status,
+                [{'$set': {'status': status, 'processed_at': None}}]
+            )
 
-        self.batch_control.update_one(
-            {'batch_path': batch_path},
-            {'$set': update}
-        )
+        self.batch_control.update_one({'batch_path': batch_path}, pipeline)
 
     @backoff.on_exception(backoff.expo, PyMongoError, max_tries=3)
-    def get_processing_stats(self):
-        """Obtém estatísticas de processamento"""
+    def get_processing_stats(self, max_age=5):
+        """
+        Obtém estatísticas de processamento
+
+        Os contadores por status e o tempo médio saem de uma única
+        agregação $facet sobre batch_control, em vez de cinco
+        count_documents mais um aggregate separados. O resultado fica em
+        cache por `max_age` segundos: monitores fazem polling com mais
+        frequência do que os números mudam (max_age=0 força a consulta).
+        """
+        now_ts = time.monotonic()
+        if self._stats_cache is not None and now_ts < self._stats_cache_expiry:
+            return self._stats_cache
+
         now = datetime.now()
         hour_ago = now - timedelta(hours=1)
-        
+
+        pipeline = [{
+            '$facet': {
+                'status_counts': [
+                    {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+                ],
+                'avg_time': [
+                    {'$match': {
+                        'status': 'completed',
+                        'processing_time': {'$exists': True}
+                    }},
+                    {'$group': {'_id': None, 'avg_time': {'$avg': '$processing_time'}}}
+                ]
+            }
+        }]
+        facets = next(iter(self.batch_control.aggregate(pipeline)), {})
+
+        by_status = {doc['_id']: doc['count']
+                     for doc in facets.get('status_counts', [])}
+        avg_docs = facets.get('avg_time', [])
+
         stats = {
-            'total_batches': self.batch_control.count_documents({}),
-            'pending_batches': self.batch_control.count_documents({'status': 'pending'}),
-            'processing_batches': self.batch_control.count_documents({'status': 'processing'}),
-            'completed_batches': self.batch_control.count_documents({'status': 'completed'}),
-            'error_batches': self.batch_control.count_documents({'status': 'error'}),
+            'total_batches': sum(by_status.values()),
+            'pending_batches': by_status.get('pending', 0),
+            'processing_batches': by_status.get('processing', 0),
+            'completed_batches': by_status.get('completed', 0),
+            'error_batches': by_status.get('error', 0),
             'last_hour_detections': self.detections.count_documents({
                 'timestamp': {'$gte': hour_ago}
             }),
-            'avg_processing_time': self._calculate_avg_processing_time()
+            'avg_processing_time': avg_docs[0]['avg_time'] if avg_docs else None
         }
-        
-        return stats
 
-    def _calculate_avg_processing_time(self):
-        """Calcula tempo médio de processamento"""
-        pipeline = [
-            {
-                '$match': {
-                    'status': 'completed',
-                    'processing_time': {'$exists': True}
-                }
-            },
-            {
-                '$group': {
-                    '_id': None,
-                    'avg_time': {'$avg': '$processing_time'}
-                }
-            }
-        ]
-        
-        result = list(self.batch_control.aggregate(pipeline))
-        return result[0]['avg_time'] if result else None
+        self._stats_cache = stats
+        self._stats_cache_expiry = now_ts + max_age
+
+        return stats
 
     def save_metrics(self, metrics):
         """Salva métricas de monitoramento"""
         try:
             self.metrics.insert_one(metrics)
         except Exception as e:
-            logger.error(f"Erro ao salvar métricas: {str(e)}")
+            logger.error("Erro ao salvar métricas: %s", e)
 
     def get_encodings_chunk(self, skip=0, limit=100):
         """Retorna chunk de encodings"""
         try:
-            employees = list(self.employees
-                           .find({"encoding": {"$exists": True}})
-                           .skip(skip)
-                           .limit(limit))
-            
-            if not employees:
+            cursor = (self.employees
+                      .find({"encoding": {"$exists": True}})
+                      .skip(skip)
+                      .limit(limit))
+
+            # Uma única passada pelo cursor, sem materializar os documentos
+            rows = []
+            names = []
+            ids = []
+            for emp in cursor:
+                rows.append(emp["encoding"])
+                names.append(emp["name"])
+                ids.append(str(emp["_id"]))
+
+            if not rows:
                 return [], [], []
-            
-            encodings = [np.array(emp["encoding"]) for emp in employees]
-            names = [emp["name"] for emp in employees]
-            ids = [str(emp["_id"]) for emp in employees]
-            
+
+            # Uma única conversão em bloco em vez de um np.array por documento
+            encodings = np.asarray(rows)
+
             return encodings, names, ids
             
         except Exception as e:
@@ -336,33 +827,189 @@ class MongoDBHandler:
         """Retorna total de encodings cadastrados"""
         return self.employees.count_documents({"encoding": {"$exists": True}})
 
+    def _invalidate_employee_cache(self):
+        """Marca o cache de encodings como desatualizado"""
+        self._emp_data_version += 1
+
+    def _refresh_employee_cache(self):
+        """
+        Garante que a matriz de encodings em memória está atualizada
+
+        Carrega os funcionários uma única vez e empilha os encodings em uma
+        matriz float32 C-contígua (N, 128), com listas paralelas de ids e
+        nomes. As escritas de funcionários incrementam a versão dos dados,
+        o que força a recarga na próxima busca; sem change stream (mongo
+        standalone), o cache também expira por TTL para enxergar escritas
+        de outros processos.
+        """
+        if (self._emp_matrix is not None
+                and self._emp_cache_version == self._emp_data_version
+                and (self._emp_cache_ttl is None
+                     or time.monotonic() < self._emp_cache_expiry)):
+            return
+
+        cursor = self.employees.find(
+            {"encoding": {"$exists": True}},
+            {"encoding": 1, "encoding_bin": 1, "encoding_q": 1,
+             "encoding_scale": 1, "name": 1}
+        )
+
+        # Uma única passada pelo cursor, sem materializar a lista de documentos
+        rows = []
+        ids = []
+        names = []
+        for emp in cursor:
+            # Preferir o blob float32 (decodificação zero-copy), depois a
+            # cópia quantizada, por fim a lista de floats legada
+            if "encoding_bin" in emp:
+                rows.append(np.frombuffer(emp["encoding_bin"], dtype=np.float32))
+            elif "encoding_q" in emp:
+                rows.append(np.asarray(emp["encoding_q"], dtype=np.float32)
+                            * emp["encoding_scale"])
+            else:
+                rows.append(emp["encoding"])
+            ids.append(str(emp["_id"]))
+            names.append(emp["name"])
+
+        if rows:
+            self._emp_matrix = np.ascontiguousarray(rows, dtype=np.float32)
+        else:
+            self._emp_matrix = np.empty((0, 128), dtype=np.float32)
+        self._emp_ids = ids
+        self._emp_names = names
+
+        # Normas² por linha, pré-computadas para o truque ||a-b||² = ||a||² + ||b||² - 2a·b
+        self._emp_sq_norms = np.einsum('ij,ij->i', self._emp_matrix, self._emp_matrix)
+
+        # Índice FAISS reconstruído junto com o cache (flat: busca exata)
+        if FAISS_AVAILABLE and len(self._emp_ids):
+            self._faiss_index = faiss.IndexFlatL2(self._emp_matrix.shape[1])
+            self._faiss_index.add(self._emp_matrix)
+        else:
+            self._faiss_index = None
+
+        self._emp_cache_version = self._emp_data_version
+        if self._emp_cache_ttl is not None:
+            self._emp_cache_expiry = time.monotonic() + self._emp_cache_ttl
+        logger.info("Cache de encodings atualizado: %d funcionários", len(self._emp_ids))
+
     def find_matching_face(self, face_encoding, tolerance=0.6):
         """
         Busca face mais próxima no banco de dados
         Retorna None se não encontrar match dentro da tolerância
         """
         try:
-            # Buscar todos os funcionários com encoding
-            employees = self.employees.find({"encoding": {"$exists": True}})
-            
-            best_match = None
-            min_distance = float('inf')
-            
-            # Comparar com cada funcionário
-            for emp in employees:
-                stored_encoding = np.array(emp["encoding"])
-                distance = face_recognition.face_distance([stored_encoding], face_encoding)[0]
-                
-                if distance < min_distance and distance <= tolerance:
-                    min_distance = distance
-                    best_match = {
-                        'employee_id': str(emp["_id"]),
-                        'name': emp["name"],
-                        'confidence': 1 - distance
-                    }
-            
-            return best_match
-            
+            self._refresh_employee_cache()
+
+            if self._emp_matrix is None or len(self._emp_ids) == 0:
+                return None
+
+            query = np.ascontiguousarray(face_encoding, dtype=np.float32)
+            tol_sq = tolerance * tolerance
+
+            if self._faiss_index is not None:
+                # Busca exata no índice flat (distâncias já vêm ao quadrado)
+                dist_arr, idx_arr = self._faiss_index.search(query[None, :], 1)
+                idx = int(idx_arr[0, 0])
+                dist_sq = float(dist_arr[0, 0])
+                if idx < 0 or dist_sq > tol_sq:
+                    return None
+            elif NUMBA_AVAILABLE:
+                # Caminho rápido: kernel compilado varre a matriz inteira
+                idx, dist_sq = _best_match(self._emp_matrix, query, tol_sq)
+                if idx < 0:
+                    return None
+            elif SIMSIMD_AVAILABLE:
+                # Kernel C-SIMD (AVX2/AVX-512) de distância² contra a matriz
+                dists = np.asarray(
+                    simsimd.cdist(query[None, :], self._emp_matrix,
+                                  metric='sqeuclidean')
+                )[0]
+                idx = int(dists.argmin())
+                dist_sq = float(dists[idx])
+                if dist_sq > tol_sq:
+                    return None
+            else:
+                # ||a-b||² = ||a||² + ||b||² - 2a·b: um único GEMV (BLAS) em vez
+                # de materializar a matriz de diferenças
+                dists = (self._emp_sq_norms
+                         - 2.0 * (self._emp_matrix @ query)
+                         + query @ query)
+                idx = int(dists.argmin())
+                dist_sq = max(float(dists[idx]), 0.0)  # arredondamento pode gerar -epsilon
+                if dist_sq > tol_sq:
+                    return None
+
+            distance = float(np.sqrt(dist_sq))
+            return {
+                'employee_id': self._emp_ids[idx],
+                'name': self._emp_names[idx],
+                'confidence': 1 - distance
+            }
+
+        except Exception as e:
+            logger.error("Erro ao buscar face no banco: %s", e)
+            return None
+
+    def find_matching_faces_batch(self, face_encodings, tolerance=0.6):
+        """
+        Busca o melhor match para várias faces de uma vez
+
+        Recebe uma lista de encodings (ex.: todas as faces de uma imagem do
+        lote) e devolve uma lista paralela com o dicionário de match ou
+        None por face. Uma única passada sobre a matriz de encodings
+        atende todas as consultas, em vez de uma chamada por face.
+        """
+        try:
+            if not len(face_encodings):
+                return []
+
+            self._refresh_employee_cache()
+
+            if self._emp_matrix is None or len(self._emp_ids) == 0:
+                return [None] * len(face_encodings)
+
+            queries = np.ascontiguousarray(face_encodings, dtype=np.float32)
+            tol_sq = tolerance * tolerance
+
+            if self._faiss_index is not None:
+                dist_mat, idx_mat = self._faiss_index.search(queries, 1)
+                idx_arr = idx_mat[:, 0]
+                dist_arr = dist_mat[:, 0]
+                idx_arr = np.where(dist_arr <= tol_sq, idx_arr, -1)
+            elif NUMBA_AVAILABLE:
+                idx_arr, dist_arr = _batch_match(queries, self._emp_matrix, tol_sq)
+            elif SIMSIMD_AVAILABLE:
+                # Mesmo kernel C-SIMD do caminho unitário, agora (Q, N)
+                dists = np.asarray(
+                    simsimd.cdist(queries, self._emp_matrix,
+                                  metric='sqeuclidean')
+                )
+                idx_arr = dists.argmin(axis=1)
+                dist_arr = dists[np.arange(len(queries)), idx_arr]
+                idx_arr = np.where(dist_arr <= tol_sq, idx_arr, -1)
+            else:
+                # (Q, N) de distâncias² via um único GEMM
+                dists = (self._emp_sq_norms[None, :]
+                         - 2.0 * (queries @ self._emp_matrix.T)
+                         + np.einsum('ij,ij->i', queries, queries)[:, None])
+                idx_arr = dists.argmin(axis=1)
+                dist_arr = dists[np.arange(len(queries)), idx_arr]
+                idx_arr = np.where(dist_arr <= tol_sq, idx_arr, -1)
+
+            results = []
+            for idx, dist_sq in zip(idx_arr, dist_arr):
+                if idx < 0:
+                    results.append(None)
+                    continue
+                distance = float(np.sqrt(max(float(dist_sq), 0.0)))
+                results.append({
+                    'employee_id': self._emp_ids[idx],
+                    'name': self._emp_names[idx],
+                    'confidence': 1 - distance
+                })
+            return results
+
         except Exception as e:
-            logger.error(f"Erro ao buscar face no banco: {str(e)}")
-            return None 
\ No newline at end of file
+            logger.error("Erro ao buscar faces em lote: %s", e)
+            return [None] * len(face_encodings) 
\ No newline at end of file
@@ -1,19 +1,47 @@
 import face_recognition
+import cv2
 import os
 import logging
-from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from datetime import datetime
-import time
-from config import FACE_RECOGNITION_TOLERANCE, PRODUCTION_LINES
+from threading import Event
+from config import (
+    FACE_RECOGNITION_TOLERANCE,
+    FACE_DETECTION_MAX_SIDE,
+    FACE_DETECTION_MODEL,
+    PRODUCTION_LINES
+)
 
 logger = logging.getLogger(__name__)
 
+def detect_face_locations(image, max_side=FACE_DETECTION_MAX_SIDE, model=FACE_DETECTION_MODEL):
+    """
+    Detecta faces rodando o HOG sobre uma versão reduzida da imagem
+
+    Fotos de cadastro costumam ter vários megapixels e o HOG varre a
+    pirâmide inteira em resolução cheia. Para localizar a face basta uma
+    cópia com lado máximo `max_side`; as coordenadas são reescaladas de
+    volta e a imagem original continua sendo usada para gerar o encoding.
+    """
+    scale = max_side / max(image.shape[:2])
+    if scale >= 1:
+        return face_recognition.face_locations(image, model=model)
+
+    small = cv2.resize(image, (0, 0), fx=scale, fy=scale)
+    locations = face_recognition.face_locations(small, model=model)
+
+    inv = 1 / scale
+    return [
+        (int(top * inv), int(right * inv), int(bottom * inv), int(left * inv))
+        for (top, right, bottom, left) in locations
+    ]
+
 class FaceProcessor:
     def __init__(self, db_handler):
         self.db_handler = db_handler
         self.running = True
         self.tolerance = FACE_RECOGNITION_TOLERANCE
+        self._stop_event = Event()
 
     def start_processing(self):
         """Inicia o processamento de lotes"""
@@ -30,12 +58,13 @@ class FaceProcessor:
                         logger.info(f"Processando {len(pending_batches)} lotes da {line_id}")
                         for batch in pending_batches:
                             self.process_batch(batch)
-                
-                time.sleep(5)
-                
+
+                # Espera interrompível: stop_processing acorda o loop na hora
+                self._stop_event.wait(5)
+
             except Exception as e:
                 logger.error(f"Erro no loop de processamento: {str(e)}")
-                time.sleep(5)
+                self._stop_event.wait(5)
 
     def process_batch(self, batch):
         """Processa um lote de imagens"""
@@ -48,9 +77,9 @@ class FaceProcessor:
         line_id = batch_path.split('/')[1]  # captured_images/linha_1/...
         
         try:
-            # Atualizar status para 'processing'
-            self.db_handler.update_batch_status(batch_path, 'processing')
-            
+            # Lote já foi marcado como 'processing' ao ser reivindicado
+            # em get_pending_batches
+
             # Processar imagens
             total_images = 0
             total_faces_detected = 0
@@ -75,14 +104,14 @@ class FaceProcessor:
                     if face_locations:
                         # Processar cada face encontrada
                         face_encodings = face_recognition.face_encodings(image, face_locations)
-                        
-                        for face_encoding in face_encodings:
-                            # Buscar match direto no banco
-                            result = self.db_handler.find_matching_face(
-                                face_encoding, 
-                                tolerance=self.tolerance
-                            )
-                            
+
+                        # Buscar matches de todas as faces da imagem de uma vez
+                        results = self.db_handler.find_matching_faces_batch(
+                            face_encodings,
+                            tolerance=self.tolerance
+                        )
+
+                        for result in results:
                             if result:
                                 employee_id = result['employee_id']
                                 name = result['name']
@@ -107,6 +136,11 @@ class FaceProcessor:
             timestamp_str = batch_path.split('/')[-1]  # formato: YYYYMMDD_HHMM
             capture_datetime = datetime.strptime(timestamp_str, "%Y%m%d_%H%M")
 
+            # Agregados pré-computados no nível do lote: consultas de
+            # estatísticas leem um escalar em vez de abrir o array detections
+            total_faces_recognized = sum(d['count'] for d in detections.values())
+            total_confidence = sum(d['confidence_sum'] for d in detections.values())
+
             # Preparar dados do lote na ordem correta
             batch_data = {
                 'line_id': line_id,
@@ -118,8 +152,10 @@ class FaceProcessor:
                 'total_images': total_images,
                 'processing_time': (datetime.now() - start_time).total_seconds(),
                 'total_faces_detected': total_faces_detected,
-                'total_faces_recognized': sum(d['count'] for d in detections.values()),
+                'total_faces_recognized': total_faces_recognized,
                 'total_faces_unknown': total_faces_unknown,
+                'avg_confidence': (total_confidence / total_faces_recognized
+                                   if total_faces_recognized else None),
                 'unique_people_recognized': len([d for d in detections.values() if d['count'] > 0]),
                 'unique_people_unknown': total_faces_unknown,
                 'detections': [
@@ -133,20 +169,31 @@ class FaceProcessor:
                 ]
             }
             
-            # Registrar no banco
-            self.db_handler.register_batch_detection(batch_data)
+            # Registrar no banco (assíncrono: a thread de escrita do handler
+            # coalesce e persiste sem segurar o pipeline de reconhecimento)
+            self.db_handler.queue_batch_detection(batch_data)
             
             # Marcar como completo
             self.db_handler.update_batch_status(batch_path, 'completed')
             
-            # Log do resumo
-            logger.info(f"Resumo do lote {batch_path}:")
-            logger.info(f"- Total de imagens: {batch_data['total_images']}")
-            logger.info(f"- Faces detectadas: {batch_data['total_faces_detected']}")
-            logger.info(f"- Faces reconhecidas: {batch_data['total_faces_recognized']}")
-            logger.info(f"- Faces não reconhecidas: {batch_data['total_faces_unknown']}")
-            logger.info(f"- Pessoas únicas reconhecidas: {batch_data['unique_people_recognized']}")
-            logger.info(f"- Pessoas únicas não reconhecidas: {batch_data['unique_people_unknown']}")
+            # Log do resumo: um único registro com formatação preguiçosa,
+            # em vez de sete chamadas formatadas por lote
+            logger.info(
+                "Resumo do lote %s:\n"
+                "- Total de imagens: %d\n"
+                "- Faces detectadas: %d\n"
+                "- Faces reconhecidas: %d\n"
+                "- Faces não reconhecidas: %d\n"
+                "- Pessoas únicas reconhecidas: %d\n"
+                "- Pessoas únicas não reconhecidas: %d",
+                batch_path,
+                batch_data['total_images'],
+                batch_data['total_faces_detected'],
+                batch_data['total_faces_recognized'],
+                batch_data['total_faces_unknown'],
+                batch_data['unique_people_recognized'],
+                batch_data['unique_people_unknown']
+            )
             
         except Exception as e:
             logger.error(f"Erro ao processar lote {batch_path}: {str(e)}")
@@ -160,6 +207,7 @@ class FaceProcessor:
     def stop_processing(self):
         """Para o processamento"""
         self.running = False
+        self._stop_event.set()
 
     def process_image(self, image_path, production_line):
         """Processa uma única imagem"""
@@ -208,7 +256,7 @@ class FaceProcessor:
         """
         try:
             image = face_recognition.load_image_file(image_path)
-            face_locations = face_recognition.face_locations(image)
+            face_locations = detect_face_locations(image)
             encodings = face_recognition.face_encodings(image, face_locations)
 
             if len(encodings) > 0:
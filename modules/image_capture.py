@@ -4,14 +4,8 @@ import os
 from datetime import datetime
 import logging
 from threading import Thread
-from config import (
-    BASE_IMAGE_DIR, 
-    CAPTURE_INTERVAL, 
-    IP_CAMERAS_CONFIG,
-    MIN_BLUR_THRESHOLD
-)
-from modules.cameras import create_camera
-from modules.image_validator import ImageValidator
+from concurrent.futures import ThreadPoolExecutor
+from config import BASE_IMAGE_DIR, CAPTURE_INTERVAL
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +20,10 @@ class ImageCapture:
         self.db_handler = None
         self.monitor_thread = None
 
+        # Cache TTL do status das câmeras (polling frequente, dado lento)
+        self._status_cache = None
+        self._status_cache_expiry = 0.0
+
     def set_db_handler(self, db_handler):
         self.db_handler = db_handler
 
@@ -75,7 +73,11 @@ class ImageCapture:
             camera = self.cameras[camera_key]
             current_minute = None
             batch_dir = None
-            
+
+            # Invariantes do loop: não mudam entre frames
+            position = camera_config.get('position', 'default')
+            line_dir = os.path.join(BASE_IMAGE_DIR, line_id)
+
             while self.running:
                 try:
                     now = datetime.now()
@@ -84,18 +86,17 @@ class ImageCapture:
                     # Verificar se começou novo minuto
                     if minute_key != current_minute:
                         current_minute = minute_key
-                        batch_dir = os.path.join(BASE_IMAGE_DIR, line_id, minute_key)
+                        batch_dir = os.path.join(line_dir, minute_key)
                         os.makedirs(batch_dir, exist_ok=True)
-                    
+
                     # Capturar frame
                     ret, frame = camera.read()
                     if not ret:
                         logger.error(f"Erro ao capturar frame da câmera {camera_key}")
                         time.sleep(1)
                         continue
-                    
+
                     # Salvar frame com posição no nome
-                    position = camera_config.get('position', 'default')
                     filename = f"{position}_frame_{now.strftime('%H%M%S')}.jpg"
                     filepath = os.path.join(batch_dir, filename)
                     cv2.imwrite(filepath, frame)
@@ -148,20 +149,43 @@ class ImageCapture:
         for camera in self.cameras.values():
             camera.release()
 
-    def check_cameras_status(self):
-        """Verifica o status atual das câmeras"""
-        status = {}
-        for camera_key, camera in self.cameras.items():
+    def check_cameras_status(self, max_age=2):
+        """
+        Verifica o status atual das câmeras
+
+        As consultas são independentes e podem bloquear (câmera IP fora do
+        ar), então rodam em paralelo: a mais lenta define o tempo total em
+        vez da soma de todas. O resultado fica em cache por `max_age`
+        segundos para polling mais rápido que isso (max_age=0 força a
+        verificação).
+        """
+        now_ts = time.monotonic()
+        if self._status_cache is not None and now_ts < self._status_cache_expiry:
+            return self._status_cache
+
+        def _check(item):
+            camera_key, camera = item
             try:
                 info = camera.get_info()
                 info['last_check'] = datetime.now().isoformat()
-                status[camera_key] = info
+                return camera_key, info
             except Exception as e:
-                status[camera_key] = {
+                return camera_key, {
                     'status': f'Erro: {str(e)}',
                     'last_check': datetime.now().isoformat()
                 }
-        return status 
+
+        cameras = list(self.cameras.items())
+        if cameras:
+            with ThreadPoolExecutor(max_workers=len(cameras)) as executor:
+                status = dict(executor.map(_check, cameras))
+        else:
+            status = {}
+
+        self._status_cache = status
+        self._status_cache_expiry = now_ts + max_age
+
+        return status
 
     def _monitor_batches(self):
         """Monitora e registra lotes completos"""